@@ -1,10 +1,43 @@
-import pandas as pd
+import math
 import numpy as np
-import random
-from copy import deepcopy
 import warnings
-import matplotlib.pyplot as plt
-import seaborn as sns
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from collections.abc import Mapping
+from enum import IntEnum
+from functools import lru_cache
+from itertools import product
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """
+        Stands in for numba.njit when Numba isn't installed, leaving the function as plain Python. As with a
+        compiled function, the plain Python version can also be reached through py_func.
+        """
+        def decorator(function):
+            function.py_func = function
+            return function
+        return decorator
+
+
+class Color(IntEnum):
+    """The colors of ingredient in the game, as the ids they are stored as in a Bag."""
+    WHITE = 0
+    ORANGE = 1
+    GREEN = 2
+    RED = 3
+    BLUE = 4
+    YELLOW = 5
+    PURPLE = 6
+    BLACK = 7
+    # every color that isn't in the game shares this id, so that the ids always fit in a uint8
+    UNKNOWN = 255
 
 
 class Player:
@@ -50,46 +83,223 @@ class Player:
             'overall_value': the total value of all ingredients pulled.
             'white_value': the total value of all white ingredients pulled.
         """
-        self.bag.reset_picked_ingredients()
+        round_values = self.simulate_rounds(1, stop_before_explosion, risk_tolerance)
+        return {key: int(values[0]) for key, values in round_values.items()}
 
-        picking = True
-        current_position = self.droplet_position + self.rat_tails
+    def simulate_rounds(self, num_rounds, stop_before_explosion=False, risk_tolerance=0):
+        """
+        Plays out many independent rounds of picking ingredients at once, each one starting with the full bag.
 
-        # in the extreme edge case that even the starting configuration is too risky, don't do anything
-        if stop_before_explosion and self.bag.chance_to_explode() > risk_tolerance:
-            picking = False
+        Parameters
+        ----------
+        num_rounds : int
+            The number of rounds to be simulated.
+        stop_before_explosion : boolean (default False)
+            Specifies whether the player should stop picking if they know they could explode.
+        risk_tolerance : int (default 0)
+            To keep pulling, would need less than x chance of blowing up; probability between 0 and 1.
 
-        while picking:
-            last_picked_ingredient = self.bag.pick_ingredient()
+        Returns
+        -------
+        dict : {np.ndarray, np.ndarray, np.ndarray}
+            The same keys as simulate_round(), each holding one value per simulated round.
+        """
+        # everything needed from the player, bag and board is read once up front, as simulate_round() goes
+        # through here for every single round
+        bag = self.bag
+        bag.reset_picked_ingredients()
 
-            # will need to expand on this for effects in the future
-            current_position += last_picked_ingredient.value
+        start_position = self.droplet_position + self.rat_tails
+        last_playable_space = self.board.last_playable_space
+        explosion_limit = bag.explosion_limit
+        values, is_white = bag.master_arrays()
 
-            has_exploded = self.bag.get_picked_white_value() > self.bag.explosion_limit
-            has_reached_end = current_position >= self.board.last_playable_space
-            has_no_ingredients = len(self.bag.ingredients['current']) == 0
-            has_exceeded_risk = stop_before_explosion and self.bag.chance_to_explode() > risk_tolerance
+        # in the extreme edge case that even the starting configuration is too risky, don't do anything
+        if values.size == 0 or (stop_before_explosion and bag.chance_to_explode() > risk_tolerance):
+            return {
+                'final_position': np.full(num_rounds, start_position, dtype=np.int16),
+                'overall_value': np.zeros(num_rounds, dtype=np.int16),
+                'white_value': np.zeros(num_rounds, dtype=np.int16)
+            }
 
-            if has_exploded or has_reached_end or has_no_ingredients or has_exceeded_risk:
-                picking = False
+        if NUMBA_AVAILABLE:
+            # the number of chunks only depends on the number of rounds, not on how many threads there are, so
+            # that the same seed gives the same rounds on any machine
+            seeds = bag.draw_seeds(max(-(-num_rounds // _ROUNDS_PER_CHUNK), 1))
+            # cast the settings so that every call shares the same compiled signature
+            final_positions, overall_values, white_values = _simulate_many(
+                values, is_white, int(start_position), int(explosion_limit), int(last_playable_space),
+                int(num_rounds), bool(stop_before_explosion), float(risk_tolerance), seeds
+            )
+        else:
+            return _join_batches([
+                _simulate_batch(*bag.draw_rounds(batch_rounds), start_position, explosion_limit,
+                                last_playable_space, stop_before_explosion, risk_tolerance)
+                for batch_rounds in _batch_sizes(num_rounds, values.size, risk_tolerance)
+            ])
 
-            # make sure the last token is not placed beyond the playable space
-            if has_reached_end:
-                current_position = self.board.last_playable_space
+        return {
+            'final_position': final_positions,
+            'overall_value': overall_values,
+            'white_value': white_values
+        }
 
-        overall_value = sum([ingredient.value for ingredient in self.bag.ingredients['picked']])
-        white_value = sum([ingredient.value for ingredient in self.bag.ingredients['picked']
-                           if ingredient.color == 'white'])
+    def simulate_strategies(self, num_rounds, risk_tolerance=0):
+        """
+        Plays out many rounds both picking until exploding and playing safe, scoring both ways of playing on the
+        same drawn rounds.
+
+        Parameters
+        ----------
+        num_rounds : int
+            The number of rounds to be simulated.
+        risk_tolerance : int (default 0)
+            To keep pulling when playing safe, would need less than x chance of blowing up; probability between 0
+            and 1.
 
+        Returns
+        -------
+        tuple of dict
+            The results of picking until exploding and of playing safe, each in the same form as simulate_rounds().
+        """
         self.bag.reset_picked_ingredients()
+        values, is_white = self.bag.master_arrays()
+        # in the extreme edge case that even the starting configuration is too risky, don't do anything
+        if values.size == 0 or self.bag.chance_to_explode() > risk_tolerance:
+            return self.simulate_rounds(num_rounds), self.simulate_rounds(num_rounds, True, risk_tolerance)
+
+        start_position = self.droplet_position + self.rat_tails
+        settings = (start_position, self.bag.explosion_limit, self.board.last_playable_space)
+
+        if NUMBA_AVAILABLE:
+            seeds = self.bag.draw_seeds(max(-(-num_rounds // _ROUNDS_PER_CHUNK), 1))
+            # cast the settings so that every call shares the same compiled signature
+            results = _simulate_both(
+                values, is_white, *(int(setting) for setting in settings), int(num_rounds), float(risk_tolerance),
+                seeds
+            )
+            return tuple({
+                'final_position': results[3 * strategy],
+                'overall_value': results[3 * strategy + 1],
+                'white_value': results[3 * strategy + 2]
+            } for strategy in range(2))
+
+        exploded_batches = []
+        safe_batches = []
+        for batch_rounds in _batch_sizes(num_rounds, values.size, risk_tolerance):
+            drawn_values, white_values = self.bag.draw_rounds(batch_rounds)
+            overall_totals, white_totals = _running_totals(drawn_values, white_values)
+            for stop_before_explosion, batches in [(False, exploded_batches), (True, safe_batches)]:
+                batches.append(_stop_picking(
+                    overall_totals, white_totals, white_values, *settings, stop_before_explosion, risk_tolerance
+                ))
+        return _join_batches(exploded_batches), _join_batches(safe_batches)
+
+    def simulate_many_bags(self, bags, num_rounds, stop_before_explosion=False, risk_tolerance=0):
+        """
+        Plays out many rounds for each of several bags of ingredients on this player's board, such as when
+        comparing which ingredients to buy.
+
+        Parameters
+        ----------
+        bags : list of Bag
+            The bags to simulate, each using its master set of ingredients and its own explosion limit.
+        num_rounds : int
+            The number of rounds to be simulated for each bag.
+        stop_before_explosion : boolean (default False)
+            Specifies whether the player should stop picking if they know they could explode.
+        risk_tolerance : int (default 0)
+            To keep pulling, would need less than x chance of blowing up; probability between 0 and 1.
+
+        Returns
+        -------
+        dict : {np.ndarray, np.ndarray, np.ndarray}
+            The same keys as simulate_round(), each holding one row of num_rounds values per bag.
+        """
+        start_position = self.droplet_position + self.rat_tails
+        last_playable_space = self.board.last_playable_space
+        for bag in bags:
+            bag.reset_picked_ingredients()
+
+        if NUMBA_AVAILABLE:
+            # pad every bag out to the biggest one so that they can be passed as one array
+            master_arrays = [bag.master_arrays() for bag in bags]
+            lengths = np.array([bag_values.size for bag_values, bag_is_white in master_arrays], dtype=np.int64)
+            values = np.zeros((len(bags), lengths.max(initial=0)), dtype=np.int8)
+            is_white = np.zeros(values.shape, dtype=bool)
+            for bag_index, (bag_values, bag_is_white) in enumerate(master_arrays):
+                values[bag_index, :lengths[bag_index]] = bag_values
+                is_white[bag_index, :lengths[bag_index]] = bag_is_white
+            explosion_limits = np.array([bag.explosion_limit for bag in bags], dtype=np.int64)
+            # each bag's rounds are seeded from that bag's own generator, as they are without Numba
+            seeds = np.concatenate([bag.draw_seeds(1) for bag in bags]) if bags else np.empty(0, dtype=np.int64)
+
+            final_positions, overall_values, white_values = _simulate_sweep(
+                values, is_white, lengths, explosion_limits, int(start_position), int(last_playable_space),
+                int(num_rounds), bool(stop_before_explosion), float(risk_tolerance), seeds
+            )
+        else:
+            final_positions = np.full((len(bags), num_rounds), start_position, dtype=np.int16)
+            overall_values = np.zeros((len(bags), num_rounds), dtype=np.int16)
+            white_values = np.zeros((len(bags), num_rounds), dtype=np.int16)
+            for bag_index, bag in enumerate(bags):
+                num_ingredients = bag.master_arrays()[0].size
+                if num_ingredients > 0:
+                    bag_values = _join_batches([
+                        _simulate_batch(*bag.draw_rounds(batch_rounds), start_position, bag.explosion_limit,
+                                        last_playable_space, stop_before_explosion, risk_tolerance)
+                        for batch_rounds in _batch_sizes(num_rounds, num_ingredients, risk_tolerance)
+                    ])
+                    final_positions[bag_index] = bag_values['final_position']
+                    overall_values[bag_index] = bag_values['overall_value']
+                    white_values[bag_index] = bag_values['white_value']
+
+        # in the extreme edge case that even the starting configuration is too risky, don't do anything
+        if stop_before_explosion:
+            for bag_index, bag in enumerate(bags):
+                if bag.chance_to_explode() > risk_tolerance:
+                    final_positions[bag_index] = start_position
+                    overall_values[bag_index] = 0
+                    white_values[bag_index] = 0
 
         return {
-            'final_position': current_position,
-            'overall_value': overall_value,
-            'white_value': white_value
+            'final_position': final_positions,
+            'overall_value': overall_values,
+            'white_value': white_values
         }
 
-    def generate_statistics(self, show_ingredients=True, show_graphs=True, num_rounds=10000, risk_tolerance=0):
+    def final_position_distribution(self, stop_before_explosion=False, risk_tolerance=0, max_states=50000):
+        """
+        Works out exactly how likely the last ingredient of a round is to be placed on each space of the board.
+
+        Parameters
+        ----------
+        stop_before_explosion : boolean (default False)
+            Specifies whether the player should stop picking if they know they could explode.
+        risk_tolerance : float (default 0)
+            To keep pulling, would need less than x chance of blowing up; probability between 0 and 1.
+        max_states : int (default 50000)
+            The most combinations of ingredients left in the bag that will be worked through.
+
+        Returns
+        -------
+        np.ndarray of float or None
+            The probability of finishing on each space, indexed by the space, or None if the bag is too big
+            to work it out exactly.
+        """
+        total_value_distribution = self.bag.exact_distribution(stop_before_explosion, risk_tolerance, max_states)
+        if total_value_distribution is None:
+            return None
+
+        # make sure the last token is not placed beyond the playable space
+        last_playable_space = self.board.last_playable_space
+        final_positions = np.minimum(
+            self.droplet_position + self.rat_tails + np.arange(total_value_distribution.size), last_playable_space
+        )
+        return np.bincount(final_positions, weights=total_value_distribution, minlength=last_playable_space + 1)
+
+    def generate_statistics(self, show_ingredients=True, show_graphs=True, num_rounds=10000, risk_tolerance=0,
+                            seed=None, exact=True, max_states=50000):
         """
         Runs simulated rounds for the bag of ingredients for both playing safe and playing until exploding
         and plots the distribution of results.
@@ -104,69 +314,466 @@ class Player:
             The number of rounds to be simulated.
         risk_tolerance: float
             The chance to explode will have to be less than the given value in order to keep picking.
-            Will be passed to simulate_round()
+            Will be passed to simulate_rounds()
+        seed: int (default None)
+            If given, reseeds the bag's random number generator first so that the statistics can be reproduced.
+        exact: bool (default True)
+            If True, the results are worked out exactly with final_position_distribution() and scaled to
+            num_rounds rounds instead of being simulated, as long as the bag is small enough to do so.
+        max_states: int (default 50000)
+            The most combinations of ingredients left in the bag that will be worked through to get the exact
+            results, with the rounds simulated instead for bigger bags.
 
         Returns
         -------
         None
         """
-        print(f'Running {num_rounds:,} rounds for a bag...')
+        if seed is not None:
+            self.bag.reseed(seed)
+
+        exploded_distribution = self.final_position_distribution(max_states=max_states) if exact else None
+        safe_distribution = self.final_position_distribution(True, risk_tolerance, max_states) if exact else None
+        is_exact = exploded_distribution is not None and safe_distribution is not None
+
+        if is_exact:
+            print(f'Working out the exact results of {num_rounds:,} rounds for a bag...')
+        else:
+            print(f'Running {num_rounds:,} rounds for a bag...')
         if show_ingredients:
             print()
             self.bag.print_ingredients('master')
 
-        exploded_round_values = []
-        for i in range(num_rounds):
-            temp_round_values = self.simulate_round()
-            exploded_round_values.append(temp_round_values['final_position'])
-        print(f'\nExploded Maximum score: {np.max(exploded_round_values)}')
-        print(f'Exploded Average score: {np.mean(exploded_round_values):.2f}')
+        # how many of the rounds the last ingredient token is placed on each space of the board
+        if is_exact:
+            exploded_occurrences = num_rounds * exploded_distribution
+            safe_occurrences = num_rounds * safe_distribution
+        else:
+            last_playable_space = self.board.last_playable_space
+            exploded_results, safe_results = self.simulate_strategies(num_rounds, risk_tolerance)
+            exploded_occurrences = np.bincount(exploded_results['final_position'], minlength=last_playable_space + 1)
+            safe_occurrences = np.bincount(safe_results['final_position'], minlength=last_playable_space + 1)
+        spaces = np.arange(exploded_occurrences.size)
+
+        print(f'\nExploded Maximum score: {spaces[exploded_occurrences > 0].max()}')
+        print(f'Exploded Average score: {np.average(spaces, weights=exploded_occurrences):.2f}')
 
-        safe_round_values = []
-        for i in range(num_rounds):
-            temp_round_values = self.simulate_round(stop_before_explosion=True, risk_tolerance=risk_tolerance)
-            safe_round_values.append(temp_round_values['final_position'])
-        print(f'\nSafe Maximum score: {np.max(safe_round_values)}')
-        print(f'Safe Average score: {np.mean(safe_round_values):.2f}')
+        print(f'\nSafe Maximum score: {spaces[safe_occurrences > 0].max()}')
+        print(f'Safe Average score: {np.average(spaces, weights=safe_occurrences):.2f}')
 
         if show_graphs:
-            exploded_df = pd.DataFrame({'value': exploded_round_values, 'run_type': 'exploded'})
-            safe_df = pd.DataFrame({'value': safe_round_values, 'run_type': 'safe'})
-            overall_df = pd.concat([exploded_df, safe_df])
+            # one pair of bars per space, from the first to the last that either strategy finishes on
+            x_values = spaces[(exploded_occurrences > 0) | (safe_occurrences > 0)]
+            x_values = np.arange(x_values.min(), x_values.max() + 1)
+            exploded_counts = exploded_occurrences[x_values]
+            safe_counts = safe_occurrences[x_values]
+
+            # only imported when plotting, so that running simulations doesn't pay for loading them
+            import matplotlib.pyplot as plt
+            import seaborn as sns
 
             sns.set_theme(style='white', palette='pastel')
-            ax = sns.histplot(
-                data=overall_df,
-                x='value',
-                hue='run_type',
-                # element='step',
-                bins=np.max(exploded_round_values),
-                discrete=True
-            )
+            fig, ax = plt.subplots()
+            # the two strategies' bars sit side by side within each space
+            safe_bars = ax.bar(x_values - 0.2, safe_counts, width=0.4, color='C1', label='Play Safe')
+            exploded_bars = ax.bar(x_values + 0.2, exploded_counts, width=0.4, color='C0', label='Explode')
 
             # getting label values to use for each set (exploded vs safe) such that the bar from that set is only
             # labelled with a number if it is the larger of the two, so that there is only one labelled bar
             # per value on the x-axis
-            x_values = list(overall_df['value'].sort_values().unique())
-            exploded_labels = []
-            safe_labels = []
-            for value in x_values:
-                exploded_count = exploded_df[['value']].loc[exploded_df['value'] == value].count()[0]
-                safe_count = safe_df[['value']].loc[safe_df['value'] == value].count()[0]
-                if exploded_count >= safe_count:
-                    exploded_labels.append(f'${self.board.money_values[value + 1]}')
-                    safe_labels.append('')
-                else:
-                    exploded_labels.append('')
-                    safe_labels.append(f'${self.board.money_values[value + 1]}')
-
-            ax.bar_label(ax.containers[0], safe_labels)
-            ax.bar_label(ax.containers[1], exploded_labels)
+            # the money is for the space after the last token, which stays on the last space at the end of the board
+            money_values, last_space = self.board.money_values, len(self.board.money_values) - 1
+            money_labels = np.array([f'${money_values[min(value + 1, last_space)]}' for value in x_values.tolist()])
+            exploded_is_larger = exploded_counts >= safe_counts
+            has_rounds = (exploded_counts > 0) | (safe_counts > 0)
+            exploded_labels = np.where(has_rounds & exploded_is_larger, money_labels, '').tolist()
+            safe_labels = np.where(has_rounds & ~exploded_is_larger, money_labels, '').tolist()
+
+            ax.bar_label(safe_bars, safe_labels)
+            ax.bar_label(exploded_bars, exploded_labels)
+            ax.set_xticks(x_values)
 
             plt.xlabel('Place of Final Ingredient Token')
-            plt.ylabel('Simulated Occurrences')
+            plt.ylabel('Expected Occurrences' if is_exact else 'Simulated Occurrences')
             plt.title('Playing Safe vs Picking Until Exploding:\nHow Often Will You Move X Spaces?')
-            plt.legend(bbox_to_anchor=(1.02, 1), loc='upper left', labels=['Play Safe', 'Explode'], title='Strategy')
+            plt.legend(bbox_to_anchor=(1.02, 1), loc='upper left', title='Strategy')
+
+
+# the number of rounds each seeded chunk of the compiled simulation runs, with prange sharing the chunks between
+# however many threads there are
+_ROUNDS_PER_CHUNK = 256
+
+# the most drawn ingredients, or pairs of them when working out chances to explode, in one batch of rounds
+_MAX_BATCH_SIZE = 2 ** 22
+
+
+def _batch_sizes(num_rounds, num_ingredients, risk_tolerance):
+    """
+    Splits a number of rounds into batches that are small enough to be drawn and worked out at once.
+
+    Parameters
+    ----------
+    num_rounds : int
+        The number of rounds to be simulated.
+    num_ingredients : int
+        The number of ingredients in the bag.
+    risk_tolerance : float
+        The risk tolerance the rounds are played with, as any above 0 need an array of every pair of picks.
+
+    Returns
+    -------
+    list of int
+        The number of rounds in each batch, adding up to num_rounds.
+    """
+    cells_per_round = num_ingredients ** 2 if risk_tolerance > 0 else num_ingredients
+    batch_rounds = max(_MAX_BATCH_SIZE // max(cells_per_round, 1), 1)
+    return [min(batch_rounds, num_rounds - start) for start in range(0, num_rounds, batch_rounds)] or [0]
+
+
+def _join_batches(batches):
+    """Combines the final positions, overall values and white values of batches of rounds into one results dict."""
+    final_positions, overall_values, white_values = (np.concatenate(arrays) for arrays in zip(*batches))
+    return {
+        'final_position': final_positions,
+        'overall_value': overall_values,
+        'white_value': white_values
+    }
+
+
+def _simulate_batch(values, white_values, start_position, explosion_limit, last_playable_space,
+                    stop_before_explosion, risk_tolerance):
+    """
+    Works out where the player would have stopped picking in each of a batch of drawn rounds.
+
+    Parameters
+    ----------
+    values : np.ndarray of int, shape (num_rounds, number of ingredients)
+        The values of the ingredients in the order that they are picked in each round.
+    white_values : np.ndarray of int, shape (num_rounds, number of ingredients)
+        The same as values, but with 0 in place of every ingredient that is not white.
+    start_position : int
+        The position on the board that the first ingredient is placed from.
+    explosion_limit : int
+        The total value of white ingredients that has to be exceeded for the player to explode.
+    last_playable_space : int
+        The last space on the board that an ingredient can be placed on.
+    stop_before_explosion : boolean
+        Specifies whether the player should stop picking if they know they could explode.
+    risk_tolerance : float
+        To keep pulling, would need less than x chance of blowing up; probability between 0 and 1.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The final position, overall value and white value of each round.
+    """
+    overall_totals, white_totals = _running_totals(values, white_values)
+    return _stop_picking(
+        overall_totals, white_totals, white_values, start_position, explosion_limit, last_playable_space,
+        stop_before_explosion, risk_tolerance
+    )
+
+
+def _running_totals(values, white_values):
+    """
+    Works out the overall and white totals after each pick of a batch of drawn rounds.
+
+    Parameters
+    ----------
+    values : np.ndarray of int, shape (num_rounds, number of ingredients)
+        The values of the ingredients in the order that they are picked in each round.
+    white_values : np.ndarray of int, shape (num_rounds, number of ingredients)
+        The same as values, but with 0 in place of every ingredient that is not white.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The running overall and white totals, the same shape as values.
+    """
+    # token values fit in int8, so the running totals of a round fit in int16 without overflowing
+    return np.cumsum(values, axis=1, dtype=np.int16), np.cumsum(white_values, axis=1, dtype=np.int16)
+
+
+def _stop_picking(overall_totals, white_totals, white_values, start_position, explosion_limit, last_playable_space,
+                  stop_before_explosion, risk_tolerance):
+    """
+    Works out the results of a batch of drawn rounds from their running totals, for one way of playing.
+
+    Parameters
+    ----------
+    overall_totals : np.ndarray of int, shape (num_rounds, number of ingredients)
+        The total value of all ingredients picked so far after each pick, from _running_totals().
+    white_totals : np.ndarray of int, shape (num_rounds, number of ingredients)
+        The total value of white ingredients picked so far after each pick, from _running_totals().
+    white_values : np.ndarray of int, shape (num_rounds, number of ingredients)
+        The value of each white ingredient in the order they are picked, with 0 for every other ingredient.
+    start_position, explosion_limit, last_playable_space, stop_before_explosion, risk_tolerance
+        The same as for _simulate_batch().
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The final position, overall value and white value of each round.
+    """
+    num_ingredients = white_values.shape[1]
+    has_exploded = white_totals > explosion_limit
+    has_reached_end = start_position + overall_totals >= last_playable_space
+    stops = has_exploded | has_reached_end
+    if stop_before_explosion and risk_tolerance == 0:
+        # with no tolerance for risk, the player stops as soon as the biggest white left could cause an explosion
+        max_whites_left = np.zeros_like(white_values)
+        max_whites_left[:, :-1] = np.maximum.accumulate(white_values[:, :0:-1], axis=1)[:, ::-1]
+        stops |= white_totals + max_whites_left > explosion_limit
+    elif stop_before_explosion:
+        # chance of exploding on the next pick, from the tokens still left in the bag after each pick
+        values_needed_to_explode = explosion_limit - white_totals + 1
+        still_in_bag = np.triu(np.ones((num_ingredients, num_ingredients), dtype=bool), k=1)
+        explosion_causing_tokens = \
+            (white_values[:, np.newaxis, :] >= values_needed_to_explode[:, :, np.newaxis]) & still_in_bag
+        tokens_left = np.arange(num_ingredients - 1, -1, -1)
+        chances_to_explode = explosion_causing_tokens.sum(axis=2) / np.maximum(tokens_left, 1)
+        stops |= chances_to_explode > risk_tolerance
+    # the bag is empty after the last pick
+    stops[:, -1] = True
+
+    last_picks = np.argmax(stops, axis=1)[:, np.newaxis]
+    overall_values = np.take_along_axis(overall_totals, last_picks, axis=1).ravel()
+    white_values = np.take_along_axis(white_totals, last_picks, axis=1).ravel()
+
+    # make sure the last token is not placed beyond the playable space
+    return np.minimum(start_position + overall_values, last_playable_space), overall_values, white_values
+
+
+@njit(cache=True)
+def _play_round(values, is_white, order, max_whites_left, start_position, explosion_limit, last_playable_space,
+                stop_before_explosion, risk_tolerance):
+    """
+    Compiled round of picking ingredients, shuffling order in place and picking until the player would stop.
+
+    order and max_whites_left are working arrays of one and one more than the number of ingredients, kept by
+    the caller so they aren't allocated for every round. Returns the overall and white value picked.
+    """
+    _shuffle_order(order)
+    return _pick_until_stop(values, is_white, order, max_whites_left, start_position, explosion_limit,
+                            last_playable_space, stop_before_explosion, risk_tolerance)
+
+
+@njit(cache=True)
+def _shuffle_order(order):
+    """Compiled Fisher-Yates shuffle of the draw order, in place."""
+    for i in range(order.size - 1, 0, -1):
+        j = np.random.randint(0, i + 1)
+        order[i], order[j] = order[j], order[i]
+
+
+@njit(cache=True)
+def _pick_until_stop(values, is_white, order, max_whites_left, start_position, explosion_limit, last_playable_space,
+                     stop_before_explosion, risk_tolerance):
+    """
+    Compiled round of picking ingredients in the given draw order until the player would stop, taking the same
+    arguments as _play_round(). Returns the overall and white value picked.
+    """
+    num_ingredients = values.size
+
+    if stop_before_explosion and risk_tolerance == 0:
+        # the biggest white still in the bag after each pick
+        for i in range(num_ingredients - 1, -1, -1):
+            ingredient = order[i]
+            white_value = values[ingredient] if is_white[ingredient] else 0
+            max_whites_left[i] = max(max_whites_left[i + 1], white_value)
+
+    overall_total = 0
+    white_total = 0
+    for pick in range(num_ingredients):
+        ingredient = order[pick]
+        overall_total += values[ingredient]
+        if is_white[ingredient]:
+            white_total += values[ingredient]
+
+        if white_total > explosion_limit or start_position + overall_total >= last_playable_space:
+            break
+
+        if stop_before_explosion and risk_tolerance == 0:
+            # with no tolerance for risk, stop as soon as the biggest white left could cause an explosion
+            if white_total + max_whites_left[pick + 1] > explosion_limit:
+                break
+        elif stop_before_explosion:
+            value_needed_to_explode = explosion_limit - white_total + 1
+            explosion_causing_tokens = 0
+            for remaining in order[pick + 1:]:
+                if is_white[remaining] and values[remaining] >= value_needed_to_explode:
+                    explosion_causing_tokens += 1
+            tokens_left = num_ingredients - pick - 1
+            if tokens_left > 0 and explosion_causing_tokens / tokens_left > risk_tolerance:
+                break
+
+    return overall_total, white_total
+
+
+@njit(parallel=True, cache=True)
+def _simulate_many(values, is_white, start_position, explosion_limit, last_playable_space, num_rounds,
+                   stop_before_explosion, risk_tolerance, seeds):
+    """
+    Compiled equivalent of drawing num_rounds rounds and passing them to _simulate_batch().
+
+    Each round shuffles the ingredients in place and picks them one at a time until the player would stop. The
+    rounds are split into one chunk per seed, with each chunk run on one thread, so the results only depend on
+    the seeds given.
+    """
+    num_ingredients = values.size
+    final_positions = np.empty(num_rounds, dtype=np.int16)
+    overall_values = np.empty(num_rounds, dtype=np.int16)
+    white_values = np.empty(num_rounds, dtype=np.int16)
+
+    for chunk in prange(seeds.size):
+        np.random.seed(seeds[chunk])
+        order = np.arange(num_ingredients)
+        max_whites_left = np.zeros(num_ingredients + 1, dtype=np.int64)
+
+        for round_index in range(chunk * num_rounds // seeds.size, (chunk + 1) * num_rounds // seeds.size):
+            overall_total, white_total = _play_round(
+                values, is_white, order, max_whites_left, start_position, explosion_limit, last_playable_space,
+                stop_before_explosion, risk_tolerance
+            )
+            # make sure the last token is not placed beyond the playable space
+            final_positions[round_index] = min(start_position + overall_total, last_playable_space)
+            overall_values[round_index] = overall_total
+            white_values[round_index] = white_total
+
+    return final_positions, overall_values, white_values
+
+
+@njit(parallel=True, cache=True)
+def _simulate_both(values, is_white, start_position, explosion_limit, last_playable_space, num_rounds,
+                   risk_tolerance, seeds):
+    """
+    Compiled equivalent of _simulate_many() for picking until exploding and playing safe on the same rounds.
+
+    Each round is shuffled once and then picked through both ways, so the two results of a round can be compared.
+    Returns the final positions, overall values and white values of picking until exploding, followed by the same
+    for playing safe.
+    """
+    num_ingredients = values.size
+    results = np.empty((6, num_rounds), dtype=np.int16)
+
+    for chunk in prange(seeds.size):
+        np.random.seed(seeds[chunk])
+        order = np.arange(num_ingredients)
+        max_whites_left = np.zeros(num_ingredients + 1, dtype=np.int64)
+
+        for round_index in range(chunk * num_rounds // seeds.size, (chunk + 1) * num_rounds // seeds.size):
+            _shuffle_order(order)
+            for strategy in range(2):
+                overall_total, white_total = _pick_until_stop(
+                    values, is_white, order, max_whites_left, start_position, explosion_limit,
+                    last_playable_space, strategy == 1, risk_tolerance
+                )
+                # make sure the last token is not placed beyond the playable space
+                results[3 * strategy, round_index] = min(start_position + overall_total, last_playable_space)
+                results[3 * strategy + 1, round_index] = overall_total
+                results[3 * strategy + 2, round_index] = white_total
+
+    return results
+
+
+@njit(parallel=True, cache=True)
+def _simulate_sweep(values, is_white, lengths, explosion_limits, start_position, last_playable_space, num_rounds,
+                    stop_before_explosion, risk_tolerance, seeds):
+    """
+    Compiled equivalent of _simulate_many() for many bags at once, with one bag per row of values and is_white.
+
+    Rows are padded out to the biggest bag, with lengths giving how many ingredients each bag really has and
+    explosion_limits the explosion limit of each bag. Each bag is run on one thread with its own seed, so the
+    results only depend on the seeds given.
+    """
+    num_bags, max_ingredients = values.shape
+    final_positions = np.empty((num_bags, num_rounds), dtype=np.int16)
+    overall_values = np.empty((num_bags, num_rounds), dtype=np.int16)
+    white_values = np.empty((num_bags, num_rounds), dtype=np.int16)
+
+    for bag_index in prange(num_bags):
+        np.random.seed(seeds[bag_index])
+        num_ingredients = lengths[bag_index]
+        bag_values = values[bag_index, :num_ingredients]
+        bag_is_white = is_white[bag_index, :num_ingredients]
+        order = np.arange(num_ingredients)
+        max_whites_left = np.zeros(num_ingredients + 1, dtype=np.int64)
+
+        for round_index in range(num_rounds):
+            overall_total, white_total = _play_round(
+                bag_values, bag_is_white, order, max_whites_left, start_position, explosion_limits[bag_index],
+                last_playable_space, stop_before_explosion, risk_tolerance
+            )
+            # make sure the last token is not placed beyond the playable space
+            final_positions[bag_index, round_index] = min(start_position + overall_total, last_playable_space)
+            overall_values[bag_index, round_index] = overall_total
+            white_values[bag_index, round_index] = white_total
+
+    return final_positions, overall_values, white_values
+
+
+@lru_cache(maxsize=128)
+def _exact_distribution(token_counts, explosion_limit, stop_before_explosion, risk_tolerance):
+    """
+    Cached calculation behind Bag.exact_distribution(), so the same bag is only worked through once.
+
+    Parameters
+    ----------
+    token_counts : tuple of ((bool, int), int)
+        Whether each kind of token in the bag is white and its value, paired with how many of it there are.
+    explosion_limit, stop_before_explosion, risk_tolerance
+        The same as for Bag.exact_distribution().
+
+    Returns
+    -------
+    np.ndarray of float
+        The probability of the picked ingredients adding up to each value, indexed by that value. The array is
+        shared between calls, so it is read-only.
+    """
+    token_values = [value for (is_white, value), count in token_counts]
+    token_white_values = [value if is_white else 0 for (is_white, value), count in token_counts]
+    total_white_value = sum(value * count for value, (token, count) in zip(token_white_values, token_counts))
+    max_total = sum(value * count for value, (token, count) in zip(token_values, token_counts))
+    starting_counts = tuple(count for token, count in token_counts)
+
+    # every combination of tokens that could be left in the bag, grouped by how many tokens are left, so that the
+    # distributions can be built up from the empty bag one pick at a time without recursing once per pick
+    states_by_num_left = defaultdict(list)
+    for counts_left in product(*(range(count + 1) for count in starting_counts)):
+        states_by_num_left[sum(counts_left)].append(counts_left)
+
+    # each layer only needs the layer with one fewer token left, so only the last one is kept
+    distributions = {}
+    for num_left in range(sum(starting_counts) + 1):
+        fewer_left_distributions = distributions
+        distributions = {}
+        for counts_left in states_by_num_left[num_left]:
+            # the distribution of the value still to be picked, given how many of each token are left
+            white_value_left = sum(value * count for value, count in zip(token_white_values, counts_left))
+            picked_white_value = total_white_value - white_value_left
+
+            stop_picking = num_left == 0 or picked_white_value > explosion_limit
+            if not stop_picking and stop_before_explosion:
+                value_needed_to_explode = explosion_limit - picked_white_value + 1
+                explosion_causing_tokens = sum(count for value, count in zip(token_white_values, counts_left)
+                                               if value >= value_needed_to_explode)
+                stop_picking = explosion_causing_tokens / num_left > risk_tolerance
+
+            distribution = np.zeros(max_total + 1)
+            if stop_picking:
+                distribution[0] = 1
+            else:
+                for token, count in enumerate(counts_left):
+                    if count > 0:
+                        after_pick = fewer_left_distributions[
+                            counts_left[:token] + (count - 1,) + counts_left[token + 1:]
+                        ]
+                        value = token_values[token]
+                        distribution[value:] += count / num_left * after_pick[:max_total + 1 - value]
+            distributions[counts_left] = distribution
+
+    distribution = distributions[starting_counts]
+    distribution.flags.writeable = False
+    return distribution
 
 
 class Board:
@@ -204,12 +811,79 @@ class Ingredient:
     ----------
     color : str
         The color of the ingredient. Determines the effect activated when picked.
+    color_id : int
+        The Color id of the ingredient's color, which is Color.UNKNOWN for colors outside the game.
     value : int
         The value on the ingredient token; Determines how many spaces it will advance when picked.
     """
+    # a tuple of Ingredients is built every time a set of a bag is looked up, so they are kept without a __dict__
+    __slots__ = ('color', 'color_id', 'value')
+
     def __init__(self, color, value):
-        self.color = color
-        self.value = value
+        object.__setattr__(self, 'color', color)
+        object.__setattr__(self, 'color_id', Bag.color_id(color))
+        object.__setattr__(self, 'value', value)
+
+    def __setattr__(self, name, value):
+        # the ingredients looked up from a bag are copies of what it stores, so changing one would do nothing
+        raise AttributeError(f"Ingredient is immutable, so '{name}' can't be set; make a new Ingredient instead")
+
+    def __reduce__(self):
+        # copying and pickling would otherwise try to set the slots through __setattr__
+        return Ingredient._from_color_id, (self.color_id, self.value, self.color)
+
+    @classmethod
+    def _from_color_id(cls, color_id, value, color=None):
+        """Make an ingredient straight from a known color id, named after the id unless a color is given."""
+        ingredient = cls.__new__(cls)
+        object.__setattr__(ingredient, 'color', Bag._color_names[color_id] if color is None else color)
+        object.__setattr__(ingredient, 'color_id', color_id)
+        object.__setattr__(ingredient, 'value', value)
+        return ingredient
+
+
+class _IngredientSets(Mapping):
+    """
+    The 'master', 'current' and 'picked' sets of ingredients in a Bag, each seen as a tuple of Ingredients.
+
+    The bag stores every set as an array of values and an array of color ids, so a tuple is built when a set is
+    looked up and assigning a sequence of Ingredients to a set replaces that set's arrays. The tuple and the
+    Ingredients in it can't be changed in place, so that changes can't be silently lost.
+    """
+    def __init__(self, bag):
+        self._bag = bag
+        # the tuple last built for each set, along with the arrays it was built from
+        self._tuples = {}
+
+    def __getitem__(self, set_of_ingredients):
+        values = self._bag._values[set_of_ingredients]
+        colors = self._bag._colors[set_of_ingredients]
+        # any change to a set replaces its arrays rather than changing them in place, so the tuple built last time
+        # can be given again for as long as the set still has the same arrays
+        cached = self._tuples.get(set_of_ingredients)
+        if cached is not None and cached[0] is values and cached[1] is colors:
+            return cached[2]
+
+        ingredients = tuple(self._bag._ingredient(color_id, value)
+                            for color_id, value in zip(colors.tolist(), values.tolist()))
+        self._tuples[set_of_ingredients] = (values, colors, ingredients)
+        return ingredients
+
+    def __setitem__(self, set_of_ingredients, ingredients):
+        if set_of_ingredients not in Bag._VALID_SETS:
+            raise KeyError(set_of_ingredients)
+        self._bag._set_arrays(
+            set_of_ingredients,
+            np.array([ingredient.value for ingredient in ingredients], dtype=np.int8),
+            np.array([self._bag._stored_color_id(ingredient.color, add=True) for ingredient in ingredients],
+                     dtype=np.uint8)
+        )
+
+    def __iter__(self):
+        return iter(self._bag._values)
+
+    def __len__(self):
+        return len(self._bag._values)
 
 
 class Bag:
@@ -218,23 +892,145 @@ class Bag:
 
     Attributes
     ----------
-    ingredients : dict of lists of the Ingredient class
+    ingredients : dict-like of tuples of the Ingredient class
         'master': all ingredients available to the player.
         'current': the ingredients currently in the bag that have not been picked.
         'picked': the ingredients that have been picked and are no longer in the bag.
+    master, current, picked : tuple of the Ingredient class
+        The same sets as in ingredients, looked up or assigned as attributes.
     explosion_limit : int
         The total value of white ingredients that have to be exceeded when pulled in order
         for the player to explode.
+
+    Notes
+    -----
+    Each set of ingredients is stored as an array of values and an array of color ids. Looking up a set in
+    ingredients gives an immutable tuple of Ingredients, built again only after the set changes; to change a set, assign a new sequence of Ingredients
+    to it, or use add_ingredient() and remove_ingredient().
     """
+    _VALID_SETS = frozenset({'master', 'current', 'picked'})
+    # the ids of the colors come from Color; each bag stores any colors outside the game under ids of its own
+    _color_names = {color: color.name.lower() for color in Color}
+    _color_ids = {color.name.lower(): color for color in Color}
 
-    def __init__(self):
-        """Initialise the bag with the standard starting ingredients."""
-        self.ingredients = {'master': [], 'current': [], 'picked': []}
+    # the starting ingredients: white 1, 1, 1, 1, 2, 2, 3, orange 1 and green 1
+    _DEFAULT_VALUES = np.array([1, 1, 1, 1, 2, 2, 3, 1, 1], dtype=np.int8)
+    _DEFAULT_COLORS = np.array([Color.WHITE] * 7 + [Color.ORANGE, Color.GREEN], dtype=np.uint8)
+
+    def __init__(self, seed=None):
+        """
+        Initialise the bag with the standard starting ingredients.
+
+        Parameters
+        ----------
+        seed : int (default None)
+            Seed for the bag's random number generator, so that the ingredients it picks can be reproduced. Rounds
+            simulated from the same seed are the same however many threads Numba uses, but differ between running
+            with and without Numba, as the two draw their rounds differently.
+        """
+        self._values = {'master': None, 'current': None, 'picked': None}
+        self._colors = {'master': None, 'current': None, 'picked': None}
+        self._values_by_color = {'master': {}, 'current': {}, 'picked': {}}
+        self._color_sums = {'master': {}, 'current': {}, 'picked': {}}
+        self._stored_color_ids = dict(self._color_ids)
+        self._stored_color_names = dict(self._color_names)
+        self.ingredients = _IngredientSets(self)
+        self._rng = np.random.default_rng(seed)
         self.return_to_baseline()
-        self.ingredients['current'] = deepcopy(self.ingredients['master'])
-        self.ingredients['picked'] = []
         self.explosion_limit = 7
 
+    @property
+    def master(self):
+        """All ingredients available to the player, as a tuple of Ingredients."""
+        return self.ingredients['master']
+
+    @master.setter
+    def master(self, ingredients):
+        self.ingredients['master'] = ingredients
+
+    @property
+    def current(self):
+        """The ingredients currently in the bag that have not been picked, as a tuple of Ingredients."""
+        return self.ingredients['current']
+
+    @current.setter
+    def current(self, ingredients):
+        self.ingredients['current'] = ingredients
+
+    @property
+    def picked(self):
+        """The ingredients that have been picked and are no longer in the bag, as a tuple of Ingredients."""
+        return self.ingredients['picked']
+
+    @picked.setter
+    def picked(self, ingredients):
+        self.ingredients['picked'] = ingredients
+
+    @classmethod
+    def color_id(cls, color):
+        """Gives the Color id of a color of ingredient, which is Color.UNKNOWN for colors outside the game."""
+        return cls._color_ids.get(color, Color.UNKNOWN)
+
+    def _stored_color_id(self, color, add=False):
+        """
+        Gives the id that a color is stored as in this bag, or None if it has none yet and add is False.
+
+        Colors in the game are stored as their Color id. Any other colors get the ids between Color.BLACK and
+        Color.UNKNOWN as they are first added to the bag, so that they can still be told apart by name.
+        """
+        color_id = self._stored_color_ids.get(color)
+        if color_id is None and add:
+            color_id = Color.BLACK + len(self._stored_color_ids) - len(self._color_ids) + 1
+            if color_id >= Color.UNKNOWN:
+                raise ValueError(f"A bag can't hold more than {Color.UNKNOWN - Color.BLACK - 1} colors outside the "
+                                 f"game, so '{color}' can't be added.")
+            self._stored_color_ids[color] = color_id
+            self._stored_color_names[color_id] = color
+        return color_id
+
+    def _ingredient(self, color_id, value):
+        """Make an ingredient from the id its color is stored as in this bag."""
+        color = self._stored_color_names[color_id]
+        return Ingredient._from_color_id(self._color_ids.get(color, Color.UNKNOWN), value, color)
+
+    def _set_arrays(self, set_of_ingredients, values, colors):
+        """Replace the values and color ids stored for the given set of ingredients."""
+        self._values[set_of_ingredients] = values
+        self._colors[set_of_ingredients] = colors
+        if set_of_ingredients in ('current', 'picked'):
+            self._current_shuffled = False
+
+        # the values of each color in the set are kept sorted, along with their totals, so that the colors in the
+        # set, sums, maxes and the number of whites big enough to cause an explosion don't need a scan of the bag
+        values_by_color = {}
+        for color_id, value in zip(colors.tolist(), values.tolist()):
+            values_by_color.setdefault(color_id, []).append(value)
+        for color_values in values_by_color.values():
+            color_values.sort()
+        self._values_by_color[set_of_ingredients] = values_by_color
+        self._color_sums[set_of_ingredients] = {color_id: sum(color_values)
+                                                for color_id, color_values in values_by_color.items()}
+
+    def _color_mask(self, color, set_of_ingredients):
+        """Gives a boolean array of which ingredients in the given set are of the given (stored) color."""
+        return self._colors[set_of_ingredients] == self._stored_color_ids[color]
+
+    def _add_to_color_index(self, set_of_ingredients, color_id, value):
+        """Add a value to the sorted values and total kept for its color in the given set."""
+        insort(self._values_by_color[set_of_ingredients].setdefault(color_id, []), value)
+        color_sums = self._color_sums[set_of_ingredients]
+        color_sums[color_id] = color_sums.get(color_id, 0) + value
+
+    def _remove_from_color_index(self, set_of_ingredients, color_id, value):
+        """Remove a value from the sorted values and total kept for its color in the given set."""
+        values_by_color = self._values_by_color[set_of_ingredients]
+        color_sums = self._color_sums[set_of_ingredients]
+        color_values = values_by_color[color_id]
+        del color_values[bisect_left(color_values, value)]
+        color_sums[color_id] -= value
+        if not color_values:
+            del values_by_color[color_id], color_sums[color_id]
+
     def print_ingredients(self, set_of_ingredients='current'):
         """
         Prints out a list of all the ingredient values in the bag, grouped by color.
@@ -249,14 +1045,17 @@ class Bag:
         -------
         None
         """
-        if set_of_ingredients in ['master', 'current', 'picked']:
-            ingredients = self.ingredients[set_of_ingredients]
+        if set_of_ingredients in self._VALID_SETS:
             print(f"Showing the '{set_of_ingredients}' set of ingredients:")
 
-            unique_colors = list(dict.fromkeys([ingredient.color for ingredient in ingredients]))
-            for color in unique_colors:
-                print(f'    {color}: ', end='')
-                print([ingredient.value for ingredient in ingredients if ingredient.color == color])
+            # grouped in a single pass rather than using the sorted values kept for each color, so that the values
+            # are shown in the order they are in the set
+            values_by_color = defaultdict(list)
+            colors = self._colors[set_of_ingredients].tolist()
+            for color_id, value in zip(colors, self._values[set_of_ingredients].tolist()):
+                values_by_color[color_id].append(value)
+            for color_id, color_values in values_by_color.items():
+                print(f'    {self._stored_color_names[color_id]}: {color_values}')
         else:
             print(f"The '{set_of_ingredients}' set of ingredients does not exist.")
 
@@ -276,9 +1075,8 @@ class Bag:
         sum : int
             The sum of the values of all the tokens of the given color.
         """
-        if set_of_ingredients in ['master', 'current', 'picked']:
-            return sum([ingredient.value for ingredient in self.ingredients[set_of_ingredients]
-                        if ingredient.color == color])
+        if set_of_ingredients in self._VALID_SETS:
+            return self._color_sums[set_of_ingredients].get(self._stored_color_id(color), 0)
         else:
             warnings.warn(f"There is no set of ingredients '{set_of_ingredients}', so the sum will be 0.")
             return 0
@@ -299,40 +1097,34 @@ class Bag:
         max : int
             The max of the values of all the tokens of the given color.
         """
-        if set_of_ingredients in ['master', 'current', 'picked']:
-            len_chosen_ingredients = len(self.ingredients[set_of_ingredients])
-            colors_chosen_ingredients = list(
-                dict.fromkeys([ingredient.color for ingredient in self.ingredients[set_of_ingredients]])
-            )
-            if len_chosen_ingredients == 0 or color not in colors_chosen_ingredients:
-                return 0
-            else:
-                return max(
-                    [ingredient.value for ingredient in self.ingredients[set_of_ingredients] if
-                     ingredient.color == color]
-                )
+        if set_of_ingredients in self._VALID_SETS:
+            color_values = self._values_by_color[set_of_ingredients].get(self._stored_color_id(color))
+            return color_values[-1] if color_values else 0
         else:
             warnings.warn(f"There is no set of ingredients '{set_of_ingredients}', so the max will be 0.")
             return 0
 
     def get_picked_white_value(self):
         """Gives the total of all the white ingredients that have been picked so far"""
-        return sum([ingredient.value for ingredient in self.ingredients['picked'] if ingredient.color == 'white'])
+        # kept up to date by pick_ingredient(), so there's no need to add up the picked set again
+        return self._color_sums['picked'].get(Color.WHITE, 0)
 
     def chance_to_explode(self):
         """Get the probability of exploding on the next pick based on what has been picked so far"""
         value_needed_to_explode = self.explosion_limit - self.get_picked_white_value() + 1
-        if self.max_ingredient_color('white') < value_needed_to_explode \
-                or len(self.ingredients['current']) == 0:
-            chance_to_explode = 0
-        else:
-            explosion_causing_tokens = [
-                ingredient for ingredient in self.ingredients['current']
-                if ingredient.color == 'white' and ingredient.value >= value_needed_to_explode
-            ]
-            chance_to_explode = len(explosion_causing_tokens) / len(self.ingredients['current'])
+        num_current = self._values['current'].size
+        if num_current == 0:
+            return 0.0
 
-        return chance_to_explode
+        # the explosion has already happened, or no white left is big enough to cause one
+        if value_needed_to_explode <= 0:
+            return 1.0
+        current_whites = self._values_by_color['current'].get(Color.WHITE)
+        if not current_whites or current_whites[-1] < value_needed_to_explode:
+            return 0.0
+
+        explosion_causing_tokens = len(current_whites) - bisect_left(current_whites, value_needed_to_explode)
+        return explosion_causing_tokens / num_current
 
     def pick_ingredient(self):
         """
@@ -345,20 +1137,146 @@ class Bag:
         """
         selected_ingredient = None
 
-        if len(self.ingredients['current']) > 0:
-            selected_ingredient = random.choice(self.ingredients['current'])
-            self.ingredients['current'].remove(selected_ingredient)
-            self.ingredients['picked'].append(selected_ingredient)
+        current_values = self._values['current']
+        current_colors = self._colors['current']
+        if current_values.size > 0:
+            if not self._current_shuffled:
+                # picking one at a time without replacement gives the ingredients in a random order, so shuffle
+                # the bag once into a buffer of the picked ingredients followed by the current ones, and then
+                # take each pick from the start of the current part
+                order = self._rng.permutation(current_values.size)
+                self._draw_values = np.concatenate([self._values['picked'], current_values[order]])
+                self._draw_colors = np.concatenate([self._colors['picked'], current_colors[order]])
+                self._num_picked = self._values['picked'].size
+                self._current_shuffled = True
+
+            # moving the boundary along the buffer picks the ingredient, with both sets left as views into it
+            num_picked = self._num_picked
+            value, color_id = int(self._draw_values[num_picked]), int(self._draw_colors[num_picked])
+            self._num_picked = num_picked = num_picked + 1
+            self._values['picked'] = self._draw_values[:num_picked]
+            self._colors['picked'] = self._draw_colors[:num_picked]
+            self._values['current'] = self._draw_values[num_picked:]
+            self._colors['current'] = self._draw_colors[num_picked:]
+            self._remove_from_color_index('current', color_id, value)
+            self._add_to_color_index('picked', color_id, value)
+
+            selected_ingredient = self._ingredient(color_id, value)
         else:
             print('the bag is empty!')
 
         return selected_ingredient
 
+    def master_arrays(self):
+        """
+        Gives the master set of ingredients in the form the simulations work on.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            The int8 values of the master ingredients and a boolean array of which of them are white. The arrays
+            are the ones the bag stores, so they shouldn't be changed in place.
+        """
+        return self._values['master'], self._color_mask('white', 'master')
+
+    def draw_seeds(self, num_seeds):
+        """
+        Draws seeds from the bag's random number generator, for simulations that seed their own generators.
+
+        Parameters
+        ----------
+        num_seeds : int
+            The number of seeds to draw.
+
+        Returns
+        -------
+        np.ndarray of int
+            The seeds, each between 0 and 2 ** 32.
+        """
+        return self._rng.integers(2 ** 32, size=num_seeds)
+
+    def reseed(self, seed):
+        """Replace the bag's random number generator with one from the given seed."""
+        self._rng = np.random.default_rng(seed)
+
+    def draw_rounds(self, num_rounds):
+        """
+        Draws every one of the master ingredients in a random order, as if picking until the bag is empty,
+        independently for each of the given number of rounds.
+
+        Parameters
+        ----------
+        num_rounds : int
+            The number of rounds to draw.
+
+        Returns
+        -------
+        values : np.ndarray of int, shape (num_rounds, number of master ingredients)
+            The values of the ingredients in the order that they are picked in each round.
+        white_values : np.ndarray of int, shape (num_rounds, number of master ingredients)
+            The same as values, but with 0 in place of every ingredient that is not white.
+        """
+        values = self._values['master']
+        is_white = self._color_mask('white', 'master')
+        order = np.tile(np.arange(values.size), (num_rounds, 1))
+        self._rng.permuted(order, axis=1, out=order)
+        values = values[order]
+        return values, np.where(is_white[order], values, 0)
+
+    def exact_distribution(self, stop_before_explosion=False, risk_tolerance=0, max_states=50000):
+        """
+        Works out exactly how likely each total value of picked ingredients is at the end of a round, by going
+        through every combination of master ingredients that could be left in the bag rather than simulating.
+
+        The round ends when the explosion limit is exceeded, the bag is empty or, if stopping before explosions,
+        the chance to explode is above the risk tolerance. The end of the board isn't taken into account, so
+        totals that would go past it need to be capped at the last playable space.
+
+        Parameters
+        ----------
+        stop_before_explosion : boolean (default False)
+            Specifies whether the player should stop picking if they know they could explode.
+        risk_tolerance : float (default 0)
+            To keep pulling, would need less than x chance of blowing up; probability between 0 and 1.
+        max_states : int (default 50000)
+            The most combinations of ingredients left in the bag that will be worked through.
+
+        Returns
+        -------
+        np.ndarray of float or None
+            The probability of the picked ingredients adding up to each value, indexed by that value,
+            or None if the bag has more than max_states combinations of ingredients that could be left in it.
+            Each call gives a new copy, so changing it doesn't change the distribution cached for the bag.
+        """
+        # only whether each token is white matters to the round, so bags that only differ in their other colors
+        # share the same cached distribution
+        is_white = self._color_mask('white', 'master')
+        token_counts = tuple(sorted(Counter(zip(is_white.tolist(), self._values['master'].tolist())).items()))
+        # math.prod keeps to Python ints, which can't overflow however many kinds of token there are
+        if math.prod(count + 1 for token, count in token_counts) > max_states:
+            return None
+
+        # the cached distribution is shared with every bag of the same tokens, and kept read-only so it can't be
+        # changed through any of them
+        return _exact_distribution(token_counts, self.explosion_limit, bool(stop_before_explosion),
+                                   float(risk_tolerance)).copy()
+
     def reset_picked_ingredients(self):
         """Put all picked ingredients back in the bag,
         including those that have been added over the course of the game."""
-        self.ingredients['current'] = deepcopy(self.ingredients['master'])
-        self.ingredients['picked'] = []
+        # the arrays of a set are never changed in place, so current can share the master arrays, and the sorted
+        # values kept for each master color only need copying rather than building again
+        self._values['current'] = self._values['master']
+        self._colors['current'] = self._colors['master']
+        self._values_by_color['current'] = {color_id: color_values.copy()
+                                            for color_id, color_values in self._values_by_color['master'].items()}
+        self._color_sums['current'] = self._color_sums['master'].copy()
+
+        self._values['picked'] = self._values['master'][:0]
+        self._colors['picked'] = self._colors['master'][:0]
+        self._values_by_color['picked'] = {}
+        self._color_sums['picked'] = {}
+        self._current_shuffled = False
 
     def add_ingredient(self, color, value):
         """
@@ -375,9 +1293,11 @@ class Bag:
         -------
         Instance of the new Ingredient that is added.
         """
-        new_ingredient = Ingredient(color, value)
-        self.ingredients['master'].append(new_ingredient)
-        return new_ingredient
+        color_id = self._stored_color_id(color, add=True)
+        self._values['master'] = np.append(self._values['master'], np.int8(value))
+        self._colors['master'] = np.append(self._colors['master'], np.uint8(color_id))
+        self._add_to_color_index('master', color_id, value)
+        return self._ingredient(color_id, value)
 
     def remove_ingredient(self, color, value):
         """
@@ -395,23 +1315,20 @@ class Bag:
         If one is removed, the instance of the Ingredient class that is removed from the master list
         else None
         """
-        potential_ingredients = [
-            ingredient for ingredient in self.ingredients['master']
-            if ingredient.color == color and ingredient.value == value
-        ]
+        if color in self._stored_color_ids:
+            matches = np.flatnonzero(self._color_mask(color, 'master') & (self._values['master'] == value))
+            if matches.size > 0:
+                self._values['master'] = np.delete(self._values['master'], matches[0])
+                self._colors['master'] = np.delete(self._colors['master'], matches[0])
+                color_id = self._stored_color_ids[color]
+                self._remove_from_color_index('master', color_id, value)
+                return self._ingredient(color_id, value)
 
-        if len(potential_ingredients) > 0:
-            self.ingredients['master'].remove(potential_ingredients[0])
-            return potential_ingredients[0]
-        else:
-            warnings.warn(f"There is no ingredient in the bag that matches ({color}, {value}), "
-                          f"so none have been removed!")
-            return None
+        warnings.warn(f"There is no ingredient in the bag that matches ({color}, {value}), "
+                      f"so none have been removed!")
+        return None
 
     def return_to_baseline(self):
         """Reset the available ingredients back to the starting set."""
-        self.ingredients['master'] = []
-        self.ingredients['master'].extend([Ingredient('white', value) for value in [1, 1, 1, 1, 2, 2, 3]])
-        self.ingredients['master'].extend([Ingredient('orange', value) for value in [1]])
-        self.ingredients['master'].extend([Ingredient('green', value) for value in [1]])
+        self._set_arrays('master', self._DEFAULT_VALUES.copy(), self._DEFAULT_COLORS.copy())
         self.reset_picked_ingredients()
@@ -1,6 +1,9 @@
+import copy
+import pickle
 import pytest
+import quacks
 import warnings
-from quacks import Bag, Ingredient
+from quacks import Bag, Color, Ingredient
 
 
 class TestSumIngredientColor:
@@ -72,6 +75,13 @@ class TestMaxIngredientColor:
         bag.ingredients['current'] = []
         assert bag.max_ingredient_color('white') == 0
 
+    def test_max_after_picking(self):
+        """Check that the max and sum of the current set are updated as ingredients are picked out of the bag."""
+        bag = Bag()
+        bag.ingredients['current'] = [Ingredient('white', 3)]
+        bag.pick_ingredient()
+        assert bag.max_ingredient_color('white') == 0 and bag.sum_ingredient_color('white') == 0
+
 
 class TestPickedWhiteValue:
     def test_empty_value(self):
@@ -85,6 +95,24 @@ class TestPickedWhiteValue:
         assert bag.get_picked_white_value() == 11
 
 
+# the picked and current ingredients for when 1, 2 and 3 more are needed to explode, built once for the whole module
+ONE_NEEDED_PICKED = [Ingredient('white', 3), Ingredient('white', 2), Ingredient('white', 1), Ingredient('white', 1)]
+ONE_NEEDED_CURRENT = [
+    Ingredient('white', 2), Ingredient('white', 1), Ingredient('white', 1), Ingredient('orange', 1),
+    Ingredient('green', 1)
+]
+TWO_NEEDED_PICKED = [
+    Ingredient('white', 2), Ingredient('white', 1), Ingredient('white', 1), Ingredient('white', 1),
+    Ingredient('white', 1)
+]
+TWO_NEEDED_CURRENT = [Ingredient('white', 3), Ingredient('white', 2), Ingredient('orange', 1), Ingredient('green', 1)]
+THREE_NEEDED_PICKED = [Ingredient('white', 2), Ingredient('white', 2), Ingredient('white', 1)]
+THREE_NEEDED_CURRENT = [
+    Ingredient('white', 3), Ingredient('white', 1), Ingredient('white', 1), Ingredient('white', 1),
+    Ingredient('orange', 1), Ingredient('green', 1)
+]
+
+
 class TestChanceToExplode:
     def test_empty_current_ingredients(self):
         """Check that we're not trying to divide by 0."""
@@ -92,45 +120,44 @@ class TestChanceToExplode:
         bag.current_ingredients = []
         assert bag.chance_to_explode() == 0
 
+    def test_always_a_float(self):
+        """Check that the chance is a float for an empty bag, a safe bag and an exploded bag alike."""
+        empty_bag, exploded_bag = Bag(), Bag()
+        empty_bag.ingredients['current'] = []
+        exploded_bag.ingredients['picked'] = [Ingredient('white', 4), Ingredient('white', 4)]
+        assert all(isinstance(bag.chance_to_explode(), float) for bag in [empty_bag, Bag(), exploded_bag])
+
     def test_default_chance(self):
         """Check that with no tokens picked, the chance to explode should be 0."""
         assert Bag().chance_to_explode() == 0
 
-    def test_one_needed_to_explode(self):
-        """Check that the chance is correct when only 1 is needed to explode."""
+    @pytest.mark.parametrize('picked, current, expected_chance', [
+        (ONE_NEEDED_PICKED, ONE_NEEDED_CURRENT, 3/5),
+        (TWO_NEEDED_PICKED, TWO_NEEDED_CURRENT, 2/4),
+        (THREE_NEEDED_PICKED, THREE_NEEDED_CURRENT, 1/6)
+    ], ids=['one_needed', 'two_needed', 'three_needed'])
+    def test_needed_to_explode(self, picked, current, expected_chance):
+        """Check that only the white tokens big enough to go over the limit count towards the probability, when 1, 2
+        or 3 more are needed to explode."""
         bag = Bag()
-        bag.ingredients['picked'] = [
-            Ingredient('white', 3), Ingredient('white', 2), Ingredient('white', 1), Ingredient('white', 1)
-        ]
-        bag.ingredients['current'] = [
-            Ingredient('white', 2), Ingredient('white', 1), Ingredient('white', 1),
-            Ingredient('orange', 1), Ingredient('green', 1)
-        ]
-        assert bag.chance_to_explode() == 3/5
+        bag.ingredients['picked'] = picked
+        bag.ingredients['current'] = current
+        assert bag.chance_to_explode() == expected_chance
 
-    def test_two_needed_to_explode(self):
-        """Check that only the 2 or 3 value tokens will count towards the probability when 2 more needed to explode."""
+    def test_already_exploded(self):
+        """Check that the chance is 1 once the white tokens picked have already gone over the limit."""
         bag = Bag()
-        bag.ingredients['picked'] = [
-            Ingredient('white', 2), Ingredient('white', 1), Ingredient('white', 1), Ingredient('white', 1),
-            Ingredient('white', 1)
-        ]
-        bag.ingredients['current'] = [
-            Ingredient('white', 3), Ingredient('white', 2), Ingredient('orange', 1), Ingredient('green', 1)
-        ]
-        assert bag.chance_to_explode() == 2/4
+        bag.ingredients['picked'] = [Ingredient('white', 3), Ingredient('white', 3), Ingredient('white', 2)]
+        bag.ingredients['current'] = [Ingredient('orange', 1)]
+        assert bag.chance_to_explode() == 1
 
-    def test_three_needed_to_explode(self):
-        """Check that only the 3 value token will count towards the probability when 3 more needed to explode."""
+    def test_chance_after_picking(self):
+        """Check that the chance is updated as ingredients are picked out of the bag."""
         bag = Bag()
-        bag.ingredients['picked'] = [
-            Ingredient('white', 2), Ingredient('white', 2), Ingredient('white', 1)
-        ]
-        bag.ingredients['current'] = [
-            Ingredient('white', 3), Ingredient('white', 1), Ingredient('white', 1), Ingredient('white', 1),
-            Ingredient('orange', 1), Ingredient('green', 1)
-        ]
-        assert bag.chance_to_explode() == 1/6
+        bag.ingredients['current'] = [Ingredient('white', 4), Ingredient('white', 4)]
+        before_chance = bag.chance_to_explode()
+        bag.pick_ingredient()
+        assert before_chance == 0 and bag.chance_to_explode() == 1
 
 
 class TestPickIngredient:
@@ -147,6 +174,64 @@ class TestPickIngredient:
         picked_ingredient = bag.pick_ingredient()
         assert picked_ingredient.color == 'white' and picked_ingredient.value == 1
 
+    def test_picked_color_id(self):
+        """Check that a picked ingredient keeps the color id it is stored as in the bag."""
+        bag = Bag()
+        bag.ingredients['current'] = [Ingredient('green', 1)]
+        picked_ingredient = bag.pick_ingredient()
+        assert picked_ingredient.color_id == Bag.color_id('green') and picked_ingredient.color == 'green'
+
+    def test_color_ids_from_enum(self):
+        """Check that the colors in the game are stored as their Color ids."""
+        assert Bag.color_id('white') is Color.WHITE and Ingredient('black', 1).color_id == Color.BLACK
+
+    def test_unknown_colors_keep_their_name(self):
+        """Check that colors outside the game can be added, summed and removed by name, with an unknown Color id."""
+        bag = Bag()
+        added = bag.add_ingredient('made_up', 2)
+        bag.add_ingredient('also_made_up', 3)
+        assert (added.color, added.color_id) == ('made_up', Color.UNKNOWN)
+        assert bag.sum_ingredient_color('made_up', 'master') == 2
+        assert bag.max_ingredient_color('also_made_up', 'master') == 3
+        assert [ingredient.color for ingredient in bag.master[9:]] == ['made_up', 'also_made_up']
+        assert bag.remove_ingredient('made_up', 2).color == 'made_up'
+        assert bag.sum_ingredient_color('made_up', 'master') == 0 and len(Bag._color_names) == len(Color)
+
+    def test_unknown_colors_assigned(self):
+        """Check that colors outside the game keep their name when a set of ingredients is assigned."""
+        bag = Bag()
+        bag.master = [Ingredient('made_up', 1), Ingredient('white', 2)]
+        bag.reset_picked_ingredients()
+        assert [ingredient.color for ingredient in bag.current] == ['made_up', 'white']
+        assert bag.sum_ingredient_color('made_up') == 1
+
+    def test_too_many_unknown_colors(self):
+        """Check that a bag refuses more colors outside the game than it has ids for."""
+        bag = Bag()
+        with pytest.raises(ValueError):
+            for i in range(300):
+                bag.add_ingredient(f'made_up_color_{i}', 1)
+
+    def test_ingredient_has_no_dict(self):
+        """Check that ingredients only keep their color, color id and value."""
+        ingredient = Bag().pick_ingredient()
+        assert not hasattr(ingredient, '__dict__')
+
+    @pytest.mark.parametrize('duplicate', [copy.copy, copy.deepcopy, lambda i: pickle.loads(pickle.dumps(i))])
+    def test_ingredient_can_be_copied(self, duplicate):
+        """Check that copying or pickling an ingredient keeps its color and value."""
+        ingredients = [(Ingredient('orange', 1), Color.ORANGE), (Ingredient('made_up', 1), Color.UNKNOWN)]
+        for ingredient, color_id in ingredients:
+            duplicated = duplicate(ingredient)
+            assert (duplicated.color, duplicated.color_id, duplicated.value) == (ingredient.color, color_id, 1)
+
+    def test_seeded_picks_repeat(self):
+        """Check that bags with the same seed pick their ingredients in the same order."""
+        first_bag, second_bag = Bag(seed=1), Bag(seed=1)
+        first_picks = [first_bag.pick_ingredient().value for i in range(9)]
+        second_picks = [second_bag.pick_ingredient().value for i in range(9)]
+        assert first_picks == second_picks
+
 
 class TestResetPickedIngredients:
     def test_current_equals_master(self):
@@ -236,3 +321,120 @@ class TestReturnToBaseline:
         bag.return_to_baseline()
         returned_master_list = [(ingredient.value, ingredient.color) for ingredient in bag.ingredients['master']]
         assert original_master_list == returned_master_list and returned_master_list != modified_master_list
+
+
+class TestSetAttributes:
+    def test_same_as_ingredients(self):
+        """Check that each set looked up as an attribute matches the same set in ingredients."""
+        bag = Bag()
+        bag.current = [Ingredient('white', 2)]
+        assert [(ingredient.value, ingredient.color) for ingredient in bag.current] == [(2, 'white')]
+        assert len(bag.master) == len(bag.ingredients['master']) and bag.picked == ()
+
+    def test_cannot_change_in_place(self):
+        """Check that changing a looked up set or an ingredient in it raises an error rather than being lost."""
+        bag = Bag()
+        with pytest.raises(AttributeError):
+            bag.ingredients['master'].append(Ingredient('white', 1))
+        with pytest.raises(AttributeError):
+            bag.master[0].value = 4
+        assert len(bag.master) == 9 and bag.master[0].value == 1
+
+    def test_built_again_after_changes(self):
+        """Check that a set looked up twice gives the same tuple until the bag changes."""
+        bag = Bag(seed=1)
+        assert bag.current is bag.current
+        picked_ingredient = bag.pick_ingredient()
+        assert len(bag.current) == 8 and bag.current is bag.current
+        assert [(ingredient.color, ingredient.value) for ingredient in bag.picked] == [
+            (picked_ingredient.color, picked_ingredient.value)
+        ]
+        bag.add_ingredient('red', 1)
+        assert bag.master[-1].color == 'red'
+        bag.reset_picked_ingredients()
+        assert len(bag.current) == 10 and bag.picked == ()
+
+    def test_wrong_set_name(self):
+        """Check that a set that doesn't exist can't be assigned."""
+        with pytest.raises(KeyError):
+            Bag().ingredients['made_up_set'] = []
+
+
+class TestSimulationAccessors:
+    def test_master_arrays(self):
+        """Check that the master values and white mask match the master set of ingredients."""
+        values, is_white = Bag().master_arrays()
+        assert values.tolist() == [1, 1, 1, 1, 2, 2, 3, 1, 1] and is_white.sum() == 7
+
+    def test_reseeded_seeds_repeat(self):
+        """Check that reseeding a bag makes it draw the same seeds again."""
+        bag = Bag()
+        bag.reseed(1)
+        first_seeds = bag.draw_seeds(4)
+        bag.reseed(1)
+        assert (bag.draw_seeds(4) == first_seeds).all()
+
+
+class TestExactDistribution:
+    def test_probabilities_sum_to_one(self):
+        """Check that the probabilities of every total for the starting bag add up to 1."""
+        assert Bag().exact_distribution().sum() == pytest.approx(1)
+
+    @pytest.mark.parametrize('stop_before_explosion, expected_total', [(False, 8), (True, 7)])
+    def test_white_ones(self, stop_before_explosion, expected_total):
+        """Check that a bag of only white ones always stops at the same total."""
+        bag = Bag()
+        bag.ingredients['master'] = [Ingredient('white', 1) for i in range(1, 20)]
+        distribution = bag.exact_distribution(stop_before_explosion)
+        assert distribution[expected_total] == pytest.approx(1)
+
+    def test_too_many_states(self):
+        """Check that None is given when the bag has too many combinations of ingredients to work through."""
+        assert Bag().exact_distribution(max_states=10) is None
+
+    def test_too_many_kinds_of_token(self):
+        """Check that a bag with too many kinds of token to count the states of in an int64 is still too big."""
+        bag = Bag()
+        bag.master = [Ingredient('blue', value) for value in range(1, 71)]
+        assert bag.exact_distribution() is None
+
+    def test_many_tokens_of_one_kind(self):
+        """Check that a bag with more picks than Python's recursion limit can still be worked out."""
+        bag = Bag()
+        bag.ingredients['master'] = [Ingredient('blue', 1) for i in range(1200)]
+        assert bag.exact_distribution()[1200] == pytest.approx(1)
+
+    def test_cached_for_same_bag(self):
+        """Check that bags that only differ in their non-white colors share the same worked out distribution."""
+        bag = Bag()
+        other_bag = Bag()
+        other_bag.ingredients['master'] = (
+            [Ingredient('white', value) for value in [1, 1, 1, 1, 2, 2, 3]]
+            + [Ingredient('blue', 1), Ingredient('green', 1)]
+        )
+        assert [ingredient.color for ingredient in other_bag.ingredients['master']].count('orange') == 0
+        hits = quacks._exact_distribution.cache_info().hits
+        assert (other_bag.exact_distribution() == bag.exact_distribution()).all()
+        assert quacks._exact_distribution.cache_info().hits > hits
+
+    def test_changing_result_keeps_cache(self):
+        """Check that changing a worked out distribution doesn't change what later calls give."""
+        bag = Bag()
+        distribution = bag.exact_distribution()
+        distribution[:] = 0
+        assert bag.exact_distribution().sum() == pytest.approx(1)
+
+
+class TestDrawRounds:
+    def test_every_ingredient_drawn(self):
+        """Check that every round draws each of the master ingredients exactly once."""
+        bag = Bag()
+        values, white_values = bag.draw_rounds(100)
+        master_values = sorted(ingredient.value for ingredient in bag.ingredients['master'])
+        assert all(sorted(round_values) == master_values for round_values in values.tolist())
+        assert (white_values.sum(axis=1) == bag.sum_ingredient_color('white', 'master')).all()
+
+    def test_one_byte_per_ingredient(self):
+        """Check that the drawn values take up a single byte for each ingredient in each round."""
+        values, white_values = Bag().draw_rounds(100)
+        assert values.nbytes == white_values.nbytes == 100 * len(Bag().ingredients['master'])
@@ -1,8 +1,27 @@
+import numpy as np
 import pytest
 import warnings
+import quacks
 from quacks import Player, Board, Bag, Ingredient
 
 
+@pytest.fixture(params=[False, True], ids=['without_numba', 'with_numba'])
+def numba_available(request, monkeypatch):
+    """Runs a test both with and without Numba, the second only when Numba is installed."""
+    numba_available = request.param and quacks.NUMBA_AVAILABLE
+    monkeypatch.setattr(quacks, 'NUMBA_AVAILABLE', numba_available)
+    return numba_available
+
+
+@pytest.fixture
+def global_random_state():
+    """Puts back NumPy's global random state after a test, for tests of the kernels run as plain Python, which seed
+    it through np.random.seed rather than keeping the seeding inside compiled code."""
+    state = np.random.get_state()
+    yield
+    np.random.set_state(state)
+
+
 class TestSimulateRound:
     def test_token_beyond_last_space(self):
         """Check that the token can't be placed past the final space on the board - i.e. the final money/points
@@ -58,3 +77,170 @@ class TestSimulateRound:
         # checking that the master ingredients are correctly being used for picking and that the current and
         # master ingredients match at the end.
         assert test_round['final_position'] == 2 and current_ingredients == master_ingredients
+
+
+class TestSimulateRounds:
+    def test_one_result_per_round(self):
+        """Check that a value is given for every one of the simulated rounds."""
+        round_values = Player().simulate_rounds(100)
+        assert all(len(values) == 100 for values in round_values.values())
+
+    def test_stop_picking_when_exploded(self):
+        """Check that every round stops picking once the explosion limit is exceeded."""
+        player = Player()
+        player.bag.ingredients['master'] = [Ingredient('white', 1) for i in range(1, 20)]
+        round_values = player.simulate_rounds(100)
+        assert (round_values['final_position'] == 8).all() and (round_values['white_value'] == 8).all()
+
+    def test_too_risky_to_start(self):
+        """Check that no ingredients are picked in any round when even the starting bag is too risky."""
+        player = Player()
+        player.bag.ingredients['master'] = [Ingredient('white', 10), Ingredient('blue', 10)]
+        round_values = player.simulate_rounds(100, stop_before_explosion=True, risk_tolerance=0.49)
+        assert (round_values['final_position'] == 0).all() and (round_values['overall_value'] == 0).all()
+
+    def test_added_and_removed_ingredients_used(self):
+        """Check that ingredients added to and removed from the bag are reflected in the simulated rounds."""
+        player = Player()
+        player.bag.ingredients['master'] = [Ingredient('white', 1)]
+        player.bag.add_ingredient('blue', 2)
+        player.bag.add_ingredient('blue', 2)
+        player.bag.remove_ingredient('white', 1)
+        assert (player.simulate_rounds(100)['final_position'] == 4).all()
+
+    def test_seeded_rounds_repeat(self):
+        """Check that players whose bags share a seed simulate the same rounds."""
+        first_player, second_player = Player(), Player()
+        first_player.bag, second_player.bag = Bag(seed=1), Bag(seed=1)
+        first_round_values = first_player.simulate_rounds(100, stop_before_explosion=True)
+        second_round_values = second_player.simulate_rounds(100, stop_before_explosion=True)
+        assert all((first_round_values[key] == second_round_values[key]).all() for key in first_round_values)
+
+    @pytest.mark.parametrize('stop_before_explosion', [False, True])
+    def test_without_numba(self, monkeypatch, stop_before_explosion):
+        """Check that the NumPy fallback gives the same results as the compiled simulation for a fixed bag."""
+        monkeypatch.setattr(quacks, 'NUMBA_AVAILABLE', False)
+        player = Player()
+        player.bag.ingredients['master'] = [Ingredient('white', 1) for i in range(1, 20)]
+        round_values = player.simulate_rounds(100, stop_before_explosion=stop_before_explosion)
+        expected_position = 7 if stop_before_explosion else 8
+        assert (round_values['final_position'] == expected_position).all()
+
+    def test_without_numba_in_batches(self, monkeypatch):
+        """Check that the NumPy fallback gives one result per round when the rounds are split into batches."""
+        monkeypatch.setattr(quacks, 'NUMBA_AVAILABLE', False)
+        monkeypatch.setattr(quacks, '_MAX_BATCH_SIZE', 100)
+        round_values = Player().simulate_rounds(1005, stop_before_explosion=True, risk_tolerance=0.5)
+        assert all(values.size == 1005 for values in round_values.values())
+
+    @pytest.mark.parametrize('stop_before_explosion, risk_tolerance, expected_position', [
+        (False, 0, 8), (True, 0, 7), (True, 0.5, 7)
+    ])
+    def test_uncompiled_kernel(self, monkeypatch, global_random_state, stop_before_explosion, risk_tolerance,
+                               expected_position):
+        """Check that the plain Python versions of the compiled round functions give the expected results, so that
+        they can be run and covered without compiling."""
+        # with NUMBA_DISABLE_JIT set, the functions are already plain Python and have no py_func
+        monkeypatch.setattr(quacks, '_play_round', getattr(quacks._play_round, 'py_func', quacks._play_round))
+        simulate_many = getattr(quacks._simulate_many, 'py_func', quacks._simulate_many)
+        values = np.ones(19, dtype=np.int8)
+        is_white = np.ones(19, dtype=bool)
+        final_positions, overall_values, white_values = simulate_many(
+            values, is_white, 0, 7, 32, 10, stop_before_explosion, risk_tolerance, np.array([1, 2])
+        )
+        assert (final_positions == expected_position).all() and (white_values == overall_values).all()
+
+
+class TestSimulateStrategies:
+    def test_matches_simulate_rounds(self, numba_available):
+        """Check that both ways of playing give the same results as simulating them separately for a fixed bag."""
+        player = Player()
+        player.bag.ingredients['master'] = [Ingredient('white', 1) for i in range(1, 20)]
+        exploded_results, safe_results = player.simulate_strategies(100)
+        assert (exploded_results['final_position'] == 8).all()
+        assert (safe_results['final_position'] == 7).all()
+
+    @pytest.mark.parametrize('risk_tolerance', [0, 0.3])
+    def test_same_rounds_for_both(self, numba_available, risk_tolerance):
+        """Check that both ways of playing are scored on the same rounds, so playing safe never ends up further
+        round the board than picking until exploding in the same round."""
+        player = Player()
+        player.bag = Bag(seed=0)
+        exploded_results, safe_results = player.simulate_strategies(10000, risk_tolerance)
+        assert (safe_results['final_position'] <= exploded_results['final_position']).all()
+        assert (safe_results['overall_value'] <= exploded_results['overall_value']).all()
+
+    def test_too_risky_to_start(self, monkeypatch):
+        """Check that playing safe picks nothing when even the starting bag is too risky, while exploding still
+        picks."""
+        monkeypatch.setattr(quacks, 'NUMBA_AVAILABLE', False)
+        player = Player()
+        player.bag.ingredients['master'] = [Ingredient('white', 8)]
+        exploded_results, safe_results = player.simulate_strategies(10)
+        assert (exploded_results['overall_value'] == 8).all()
+        assert (safe_results['overall_value'] == 0).all()
+
+
+class TestSimulateManyBags:
+    def test_each_bag_simulated(self, numba_available):
+        """Check that each bag's rows come from its own ingredients, including an empty bag."""
+        bags = [Bag(), Bag(), Bag()]
+        bags[0].ingredients['master'] = [Ingredient('white', 1) for i in range(1, 20)]
+        bags[1].ingredients['master'] = [Ingredient('blue', 2), Ingredient('white', 3)]
+        bags[2].ingredients['master'] = []
+        round_values = Player().simulate_many_bags(bags, 50, stop_before_explosion=True)
+        assert round_values['final_position'].shape == (3, 50)
+        assert (round_values['final_position'][0] == 7).all()
+        assert (round_values['overall_value'][1] == 5).all()
+        assert (round_values['overall_value'][2] == 0).all()
+
+    def test_seeded_bags_repeat(self, numba_available):
+        """Check that each bag's rounds come from its own seed, whatever the player's own bag is."""
+        first_player, second_player = Player(), Player()
+        first_player.bag, second_player.bag = Bag(seed=1), Bag(seed=2)
+        first_values = first_player.simulate_many_bags([Bag(seed=3), Bag(seed=4)], 50)
+        second_values = second_player.simulate_many_bags([Bag(seed=3), Bag(seed=4)], 50)
+        assert all((first_values[key] == second_values[key]).all() for key in first_values)
+
+    def test_too_risky_to_start(self):
+        """Check that nothing is picked from a bag that is too risky from the start when playing safe."""
+        bag = Bag()
+        bag.ingredients['master'] = [Ingredient('white', 8)]
+        round_values = Player().simulate_many_bags([Bag(), bag], 10, stop_before_explosion=True)
+        assert (round_values['overall_value'][1] == 0).all() and (round_values['overall_value'][0] > 0).all()
+
+
+class TestFinalPositionDistribution:
+    def test_token_beyond_last_space(self):
+        """Check that all the probability of going past the end of the board is on the last playable space."""
+        player = Player()
+        player.bag.ingredients['master'] = [Ingredient('blue', 4) for i in range(1, 20)]
+        distribution = player.final_position_distribution()
+        assert distribution[player.board.last_playable_space] == pytest.approx(1)
+
+    def test_too_many_states(self):
+        """Check that max_states is passed on to the bag, giving None for bags with more states."""
+        assert Player().final_position_distribution(max_states=10) is None
+
+    @pytest.mark.parametrize('stop_before_explosion', [False, True])
+    def test_matches_simulated_rounds(self, stop_before_explosion):
+        """Check that the exact average final position is close to the average of many simulated rounds."""
+        player = Player()
+        player.bag = Bag(seed=1)
+        distribution = player.final_position_distribution(stop_before_explosion)
+        exact_average = (distribution * range(distribution.size)).sum()
+        simulated_average = player.simulate_rounds(100000, stop_before_explosion)['final_position'].mean()
+        assert exact_average == pytest.approx(simulated_average, abs=0.05)
+
+
+class TestGenerateStatistics:
+    @pytest.mark.parametrize('exact', [False, True])
+    def test_finishing_on_last_space(self, exact):
+        """Check that the graph can be labelled when rounds finish on the last space of the board."""
+        matplotlib = pytest.importorskip('matplotlib')
+        pytest.importorskip('seaborn')
+        matplotlib.use('Agg')
+        player = Player()
+        player.droplet_position = player.board.last_playable_space - 2
+        player.generate_statistics(show_ingredients=False, num_rounds=100, seed=1, exact=exact)
+        matplotlib.pyplot.close('all')